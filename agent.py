@@ -3,143 +3,77 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 import sys
 import asyncio
 import argparse
-from typing import List, Optional
-from dotenv import load_dotenv
-
-from llama_index.core import VectorStoreIndex, Settings
-from llama_index.core.schema import NodeWithScore, QueryBundle
-from llama_index.core.postprocessor.types import BaseNodePostprocessor
-from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-
-from openfga_sdk import ClientConfiguration, OpenFgaClient
-from openfga_sdk.credentials import Credentials
-from openfga_sdk.client.models import ClientCheckRequest
-
-from data import get_documents
-
-# Load environment variables
-load_dotenv()
-
-# Configuration for Local LLM (LM Studio)
-LLM_API_BASE = os.getenv("LLM_API_BASE", "http://127.0.0.1:1234/v1")
-LLM_MODEL = os.getenv("LLM_MODEL", "ibm/granite-4-h-tiny")
-LLM_API_KEY = os.getenv("LLM_API_KEY", "lm-studio") # Dummy key for local
-
-# Configure LlamaIndex to use the local LLM
-# We use "gpt-3.5-turbo" as the model name to satisfy LlamaIndex's validation,
-# but the request is sent to the local LM Studio server (LLM_API_BASE).
-Settings.llm = OpenAI(
-    model="gpt-3.5-turbo",
-    api_base=LLM_API_BASE,
-    api_key=LLM_API_KEY,
-)
-Settings.embed_model = "local:BAAI/bge-small-en-v1.5" # Use a local embedding model to avoid OpenAI calls completely
-
-FGA_API_URL = os.getenv("FGA_API_URL", "http://localhost:8080")
-FGA_STORE_ID = os.getenv("FGA_STORE_ID")
-
-if not FGA_STORE_ID:
-    print("Error: FGA_STORE_ID not found. Please run fga_setup.py first and set the variable.")
-    sys.exit(1)
-
-# Initialize OpenFGA Client
-fga_config = ClientConfiguration(
-    api_url=FGA_API_URL,
-    store_id=FGA_STORE_ID,
-)
-
-# Define the Node Postprocessor for Authorization
-class FGAPostprocessor(BaseNodePostprocessor):
-    user_id: str
-
-    def _postprocess_nodes(
-        self,
-        nodes: List[NodeWithScore],
-        query_bundle: Optional[QueryBundle] = None,
-    ) -> List[NodeWithScore]:
-        """
-        Filters nodes based on OpenFGA permissions.
-        """
-        authorized_nodes = []
-        
-        # We need to run async checks. 
-        # Since this method is sync, we'll run the loop here or use the sync client if available.
-        # The OpenFGA Python SDK 'OpenFgaClient' methods are coroutines.
-        # We will use a helper to run them.
-        
-        print(f"\n[FGA] Checking permissions for user: {self.user_id}")
-        
-        async def check_permissions():
-            results = []
-            async with OpenFgaClient(fga_config) as client:
-                for node in nodes:
-                    doc_id = node.node.ref_doc_id
-                    # Our doc_ids in data.py are now like "engineering_roadmap"
-                    # OpenFGA expects "document:engineering_roadmap"
-                    object_str = f"document:{doc_id}"
-                    
-
-
-                    try:
-                        response = await client.check(
-                            body=ClientCheckRequest(
-                                user=self.user_id,
-                                relation="viewer",
-                                object=object_str
-                            )
-                        )
-                        allowed = response.allowed
-                        print(f"  - Checking {object_str} -> {'ALLOWED' if allowed else 'DENIED'}")
-                        if allowed:
-                            results.append(node)
-                    except Exception as e:
-                        print(f"  - Error checking {object_str}: {e}")
-            return results
-
-        try:
-            authorized_nodes = asyncio.run(check_permissions())
-        except RuntimeError:
-            # If we are already in an event loop (e.g. jupyter), this might fail.
-            # But for a script, asyncio.run is fine.
-            pass
-            
-        return authorized_nodes
+from typing import Any, Dict
+
+# Heavy dependencies (llama_index, HuggingFace, OpenFGA) are imported lazily:
+# `--help` and queries answered by the daemon never load them.
+
+def run_in_process(user_id: str, question: str) -> Dict[str, Any]:
+    """Answer a query in this process (no daemon running)."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if not os.getenv("FGA_STORE_ID"):
+        print("Error: FGA_STORE_ID not found. Please run fga_setup.py first and set the variable.")
+        sys.exit(1)
+
+    # Loads the LLM / embedding settings and builds the index
+    from agent_api import process_query
+
+    print("Indexing documents...")
+    return asyncio.run(process_query(user_id, question))
+
+def print_result(user_id: str, result: Dict[str, Any]):
+    print(f"\n[FGA] Checking permissions for user: {user_id}")
+    for doc in result["documents"]:
+        object_str = f"document:{doc['id']}"
+        if "error" in doc:
+            print(f"  - Error checking {object_str}: {doc['error']}")
+        else:
+            print(f"  - Checking {object_str} -> {'ALLOWED' if doc['allowed'] else 'DENIED'}")
+
+    prompt = result.get("prompt")
+    if prompt:
+        print(f"\n[Prompt] prefix: {prompt['prefix_length']} chars, "
+              f"shared with earlier prompts: {prompt['shared_prefix_length']} chars")
+
+    print("\n--- Response ---")
+    print(result["answer"])
+    print("----------------")
 
 def main():
     parser = argparse.ArgumentParser(description="Secure AI Agent Demo")
-    parser.add_argument("--user", type=str, required=True, help="User ID (e.g., user:alice)")
-    parser.add_argument("--question", type=str, required=True, help="Question to ask")
+    parser.add_argument("--user", type=str, help="User ID (e.g., user:alice)")
+    parser.add_argument("--question", type=str, help="Question to ask")
+    parser.add_argument("--serve", action="store_true", help="Run as a daemon that keeps the index and models loaded")
+    parser.add_argument("--no-daemon", action="store_true", help="Always answer in-process, even if a daemon is running")
     args = parser.parse_args()
 
+    if args.serve:
+        import agent_daemon
+        agent_daemon.main()
+        return
+
+    if not args.user or not args.question:
+        parser.error("--user and --question are required (unless --serve is given)")
+
     user_id = args.user
     question = args.question
 
     print(f"--- Starting Agent for {user_id} ---")
-    
-    # 1. Load Data
-    documents = get_documents()
-    
-    # 2. Index Data
-    # In a real app, you'd load the index from disk.
-    print("Indexing documents...")
-    index = VectorStoreIndex.from_documents(documents)
-    
-    # 3. Setup Query Engine with FGA Postprocessor
-    fga_filter = FGAPostprocessor(user_id=user_id)
-    
-    query_engine = index.as_query_engine(
-        node_postprocessors=[fga_filter],
-        similarity_top_k=5
-    )
-    
-    # 4. Query
     print(f"Question: {question}")
-    response = query_engine.query(question)
-    
-    print("\n--- Response ---")
-    print(response)
-    print("----------------")
+
+    result = None
+    if not args.no_daemon:
+        from agent_daemon import query_daemon
+        result = query_daemon(user_id, question)
+        if result is None:
+            print("Agent daemon not available, falling back to in-process mode.")
+
+    if result is None:
+        result = run_in_process(user_id, question)
+
+    print_result(user_id, result)
 
 if __name__ == "__main__":
     main()
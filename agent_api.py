@@ -1,20 +1,31 @@
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
+import time
+import uuid
 import asyncio
-from typing import List, Optional, Dict, Any
+import threading
+import concurrent.futures
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Any, AsyncIterator, Awaitable, Callable, Tuple, TypeVar
 from dotenv import load_dotenv
 
 from llama_index.core import VectorStoreIndex, Settings
 from llama_index.core.schema import NodeWithScore, QueryBundle
 from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.llms import ChatMessage, MessageRole
 from llama_index.llms.openai import OpenAI
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from pydantic import Field
 
 from openfga_sdk import ClientConfiguration, OpenFgaClient
+from openfga_sdk.configuration import RetryParams
 from openfga_sdk.client.models import ClientCheckRequest
 
+from audit import AuditRecord, audit_log
 from data import get_documents
+from resilient_fga import fga_resilience
+from prompt_builder import BuiltPrompt, build_prompt, prefix_tracker
+from sessions import ChatSession, session_store
 
 # Load environment variables
 load_dotenv()
@@ -34,6 +45,8 @@ Settings.embed_model = "local:BAAI/bge-small-en-v1.5"
 
 FGA_API_URL = os.getenv("FGA_API_URL", "http://localhost:8080")
 FGA_STORE_ID = os.getenv("FGA_STORE_ID")
+# Optional: pin the authorization model (recorded in the audit log)
+FGA_MODEL_ID = os.getenv("FGA_MODEL_ID") or None
 
 if not FGA_STORE_ID:
     raise ValueError("FGA_STORE_ID not found. Please run fga_setup.py first and set the variable.")
@@ -42,8 +55,67 @@ if not FGA_STORE_ID:
 fga_config = ClientConfiguration(
     api_url=FGA_API_URL,
     store_id=FGA_STORE_ID,
+    authorization_model_id=FGA_MODEL_ID,
+    # No SDK retries: fga_resilience's deadline, hedging and circuit breaker
+    # handle failures (SDK retries of 5xx would run until the deadline)
+    retry_params=RetryParams(max_retry=0),
 )
 
+T = TypeVar("T")
+
+# Authorization model recorded in audit records: pinned via FGA_MODEL_ID,
+# otherwise the store's latest model, looked up by resolve_model_id()
+_model_id: Optional[str] = FGA_MODEL_ID
+_model_id_attempted_at: Optional[float] = None
+_model_id_task: Optional["asyncio.Future[Optional[str]]"] = None
+MODEL_ID_RETRY_SECONDS = 30.0
+
+def current_model_id() -> Optional[str]:
+    """The authorization model ID used for checks (None until resolved)."""
+    return _model_id
+
+async def resolve_model_id() -> Optional[str]:
+    """
+    Look up the store's latest authorization model, unless FGA_MODEL_ID pins
+    one. The resolved ID is also pinned in fga_config so checks are evaluated
+    against the same model that the audit log records.
+
+    The lookup has the same deadline as a permission check
+    (FGA_CHECK_TIMEOUT). Awaited at startup; request handlers call
+    ensure_model_id() instead.
+    """
+    global _model_id, _model_id_attempted_at
+    if _model_id is not None:
+        return _model_id
+    _model_id_attempted_at = time.monotonic()
+
+    try:
+        async with OpenFgaClient(fga_config) as client:
+            response = await asyncio.wait_for(client.read_latest_authorization_model(), fga_resilience.timeout)
+        _model_id = response.authorization_model.id
+        fga_config.authorization_model_id = _model_id
+    except Exception as e:
+        print(f"[FGA] Could not resolve the latest authorization model: {str(e) or type(e).__name__}")
+    return _model_id
+
+def ensure_model_id() -> Optional[str]:
+    """
+    Return the model ID if known. Otherwise start resolve_model_id() in the
+    background (at most once every MODEL_ID_RETRY_SECONDS) and return None:
+    requests never wait for the lookup.
+    """
+    global _model_id_attempted_at, _model_id_task
+    if _model_id is not None:
+        return _model_id
+    if _model_id_task is not None and not _model_id_task.done():
+        return None
+    now = time.monotonic()
+    if _model_id_attempted_at is not None and now - _model_id_attempted_at < MODEL_ID_RETRY_SECONDS:
+        return None
+    _model_id_attempted_at = now
+    _model_id_task = asyncio.ensure_future(resolve_model_id())
+    return None
+
 # Global index cache
 _index_cache: Optional[VectorStoreIndex] = None
 
@@ -55,11 +127,59 @@ def get_index() -> VectorStoreIndex:
         _index_cache = VectorStoreIndex.from_documents(documents)
     return _index_cache
 
+class SharedFGAClient:
+    """
+    A long-lived OpenFGA client for processes that answer many queries.
+
+    The client (and its HTTP connection pool) lives on a dedicated event loop
+    in a background thread, so it can be used from any thread, including the
+    executor threads LlamaIndex runs node postprocessors on.
+    """
+
+    def __init__(self, config: ClientConfiguration = fga_config):
+        self._config = config
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fga-client", daemon=True)
+        self._client: Optional[OpenFgaClient] = None
+
+    def start(self) -> "SharedFGAClient":
+        """Start the background loop and open the client."""
+        self._thread.start()
+        self._client = self._submit(self._open()).result()
+        return self
+
+    async def _open(self) -> OpenFgaClient:
+        client = OpenFgaClient(self._config)
+        await client.__aenter__()
+        return client
+
+    def _submit(self, coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, fn: Callable[[OpenFgaClient], Awaitable[T]]) -> T:
+        """Run ``fn(client)`` on the client's loop and wait for the result."""
+        if self._client is None:
+            raise RuntimeError("SharedFGAClient is not started")
+        return self._submit(fn(self._client)).result()
+
+    def close(self) -> None:
+        """Close the client and stop the background loop."""
+        if self._client is not None:
+            client, self._client = self._client, None
+            self._submit(client.__aexit__(None, None, None)).result()
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self._loop.close()
+
 class FGAPostprocessor(BaseNodePostprocessor):
     """Node postprocessor that filters nodes based on OpenFGA permissions."""
     
     user_id: str
+    request_id: Optional[str] = None
     permission_results: List[Dict[str, Any]] = Field(default_factory=list)
+    # Optional SharedFGAClient; when unset a client is opened per query
+    fga_client: Any = Field(default=None, exclude=True)
 
     def __init__(self, user_id: str, **kwargs):
         super().__init__(user_id=user_id, **kwargs)
@@ -72,61 +192,106 @@ class FGAPostprocessor(BaseNodePostprocessor):
         """
         Filters nodes based on OpenFGA permissions (async version).
         """
-        authorized_nodes = []
-        self.permission_results = []
-        
         async with OpenFgaClient(fga_config) as client:
-            for node in nodes:
-                doc_id = node.node.ref_doc_id
-                object_str = f"document:{doc_id}"
-                
-                # Get document metadata
-                doc_metadata = node.node.metadata or {}
-                title = doc_metadata.get("title", f"Document {doc_id}")
-                category = doc_metadata.get("category", "Unknown")
-                
-                try:
-                    response = await client.check(
-                        body=ClientCheckRequest(
-                            user=self.user_id,
-                            relation="viewer",
-                            object=object_str
-                        )
-                    )
-                    allowed = response.allowed
-                    
-                    # Store permission result for API response
-                    # Security: Only include text content for allowed documents
-                    result = {
-                        "id": doc_id,
-                        "title": title,
-                        "category": category,
-                        "allowed": allowed,
-                        "score": float(node.score) if node.score else 0.0,
-                    }
-                    
-                    if allowed:
-                        # Only include text for authorized documents
-                        result["text"] = node.node.text[:200] + "..." if len(node.node.text) > 200 else node.node.text
-                        authorized_nodes.append(node)
-                    else:
-                        # For unauthorized documents, don't expose text content
-                        result["text"] = "[Access Denied]"
-                    
-                    self.permission_results.append(result)
-                except Exception as e:
-                    # On error, deny access and don't expose text content
-                    self.permission_results.append({
-                        "id": doc_id,
-                        "title": title,
-                        "category": category,
-                        "allowed": False,
-                        "score": float(node.score) if node.score else 0.0,
-                        "text": "[Access Denied]",
-                        "error": str(e)
-                    })
+            return await self._check_nodes(client, nodes)
+
+    async def _check_nodes(
+        self,
+        client: OpenFgaClient,
+        nodes: List[NodeWithScore],
+    ) -> List[NodeWithScore]:
+        """
+        Runs the permission checks for all nodes concurrently with the given client.
+        """
+        results = await asyncio.gather(*(self._check_node(client, node) for node in nodes))
         
-        return authorized_nodes
+        # Keep permission results in retrieval order
+        self.permission_results = [result for result, _ in results]
+        return [node for node, (_, allowed) in zip(nodes, results) if allowed]
+
+    async def _check_node(self, client: OpenFgaClient, node: NodeWithScore) -> Tuple[Dict[str, Any], bool]:
+        """
+        Checks a single node; returns its permission result and whether it is allowed.
+        """
+        doc_id = node.node.ref_doc_id
+        object_str = f"document:{doc_id}"
+        
+        # Get document metadata
+        doc_metadata = node.node.metadata or {}
+        title = doc_metadata.get("title", f"Document {doc_id}")
+        category = doc_metadata.get("category", "Unknown")
+        
+        started = time.perf_counter()
+        try:
+            # Deadline, hedging and circuit breaker (fails closed)
+            response = await fga_resilience.check(
+                client,
+                ClientCheckRequest(
+                    user=self.user_id,
+                    relation="viewer",
+                    object=object_str
+                )
+            )
+            allowed = response.allowed
+            self.audit(object_str, allowed, started)
+            
+            # Store permission result for API response
+            # Security: Only include text content for allowed documents
+            result = {
+                "id": doc_id,
+                "title": title,
+                "category": category,
+                "allowed": allowed,
+                "score": float(node.score) if node.score else 0.0,
+            }
+            
+            if allowed:
+                # Only include text for authorized documents
+                result["text"] = node.node.text[:200] + "..." if len(node.node.text) > 200 else node.node.text
+            else:
+                # For unauthorized documents, don't expose text content
+                result["text"] = "[Access Denied]"
+            
+            return result, allowed
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            self.audit(object_str, False, started, error=error)
+            # On error, deny access and don't expose text content
+            return {
+                "id": doc_id,
+                "title": title,
+                "category": category,
+                "allowed": False,
+                "score": float(node.score) if node.score else 0.0,
+                "text": "[Access Denied]",
+                "error": error
+            }, False
+
+    def audit(
+        self,
+        object_str: str,
+        allowed: bool,
+        started: float,
+        error: Optional[str] = None,
+        source: str = "query",
+        decided_at: Optional[str] = None,
+    ):
+        """
+        Queue an audit record for one decision (non-blocking). Also used for
+        decisions reused from a session's cache (source="session_cache").
+        """
+        audit_log.record(AuditRecord(
+            user=self.user_id,
+            object=object_str,
+            relation="viewer",
+            allowed=allowed,
+            model_id=current_model_id(),
+            latency_ms=(time.perf_counter() - started) * 1000,
+            request_id=self.request_id,
+            source=source,
+            error=error,
+            decided_at=decided_at,
+        ))
 
     def _postprocess_nodes(
         self,
@@ -136,12 +301,15 @@ class FGAPostprocessor(BaseNodePostprocessor):
         """
         Sync wrapper for async postprocessing.
         """
+        if self.fga_client is not None:
+            # Long-lived client (daemon mode): run on the client's own loop
+            return self.fga_client.run(lambda client: self._check_nodes(client, nodes))
+
         try:
             loop = asyncio.get_event_loop()
             if loop.is_running():
                 # If we're already in an event loop, we need to handle this differently
                 # For now, create a new task
-                import concurrent.futures
                 with concurrent.futures.ThreadPoolExecutor() as executor:
                     future = executor.submit(asyncio.run, self._postprocess_nodes_async(nodes, query_bundle))
                     return future.result()
@@ -151,9 +319,23 @@ class FGAPostprocessor(BaseNodePostprocessor):
             # Fallback: run in new event loop
             return asyncio.run(self._postprocess_nodes_async(nodes, query_bundle))
 
-async def process_query(user_id: str, question: str) -> Dict[str, Any]:
+def _chat_messages(prompt: BuiltPrompt) -> List[ChatMessage]:
+    return [
+        ChatMessage(role=MessageRole.SYSTEM, content=prompt.system),
+        ChatMessage(role=MessageRole.USER, content=prompt.user),
+    ]
+
+async def process_query(
+    user_id: str,
+    question: str,
+    fga_client: Optional[SharedFGAClient] = None,
+) -> Dict[str, Any]:
     """
     Process a query with authorization checks.
+
+    Args:
+        fga_client: Optional long-lived client to reuse instead of opening
+            a new OpenFGA client for this query.
     
     Returns:
         Dictionary containing:
@@ -161,26 +343,45 @@ async def process_query(user_id: str, question: str) -> Dict[str, Any]:
         - documents: List of documents with permission results
         - allowed_count: Number of allowed documents
         - total_count: Total number of retrieved documents
+        - prompt: Prompt prefix statistics (prefix_length, shared_prefix_length, ...),
+          or None when no prompt was sent to the LLM
+        - request_id: ID linking this query to its audit log records
     """
     import asyncio
     
+    ensure_model_id()
+    
     # Get index
     index = get_index()
     
-    # Setup query engine with FGA postprocessor
-    fga_filter = FGAPostprocessor(user_id=user_id)
-    
-    query_engine = index.as_query_engine(
-        node_postprocessors=[fga_filter],
-        similarity_top_k=5
+    # Setup retriever and FGA postprocessor
+    fga_filter = FGAPostprocessor(
+        user_id=user_id,
+        request_id=uuid.uuid4().hex,
+        fga_client=fga_client,
     )
+    retriever = index.as_retriever(similarity_top_k=5)
     
-    # Query (LlamaIndex query is synchronous, so we run it in executor)
+    def run_query():
+        nodes = retriever.retrieve(question)
+        authorized_nodes = fga_filter.postprocess_nodes(nodes, query_str=question)
+        
+        # Deterministic prompt: fixed prefix, context in document-ID order,
+        # question last (keeps the LLM server's prefix cache warm)
+        prompt = build_prompt(question, authorized_nodes)
+        
+        if not authorized_nodes:
+            # Same behavior as the LlamaIndex response synthesizer.
+            # No LLM call, so nothing is recorded in the prefix tracker.
+            return "Empty Response", None
+        
+        prompt_stats = prefix_tracker.record(prompt)
+        response = Settings.llm.chat(_chat_messages(prompt))
+        return response.message.content or "", prompt_stats
+    
+    # Query (LlamaIndex retrieval and LLM calls are synchronous, so we run them in executor)
     loop = asyncio.get_event_loop()
-    response = await loop.run_in_executor(
-        None,
-        lambda: query_engine.query(question)
-    )
+    answer, prompt_stats = await loop.run_in_executor(None, run_query)
     
     # Get permission results from postprocessor
     documents = fga_filter.permission_results
@@ -188,9 +389,148 @@ async def process_query(user_id: str, question: str) -> Dict[str, Any]:
     total_count = len(documents)
     
     return {
-        "answer": str(response),
+        "answer": str(answer),
         "documents": documents,
         "allowed_count": allowed_count,
-        "total_count": total_count
+        "total_count": total_count,
+        "prompt": prompt_stats,
+        "request_id": fga_filter.request_id,
     }
 
+def _prepare_session_turn(
+    session: ChatSession,
+    question: str,
+    fga_client: Optional[SharedFGAClient] = None,
+) -> Tuple[Optional[BuiltPrompt], Dict[str, Any]]:
+    """
+    Retrieve and authorize context for one session turn.
+
+    Nodes retrieved for this question are merged with the session's working
+    set; only documents without a fresh cached decision are checked against
+    OpenFGA. Returns the prompt (None if nothing is allowed) and the turn
+    result without the answer.
+    """
+    index = get_index()
+    retriever = index.as_retriever(similarity_top_k=5)
+    nodes = retriever.retrieve(question)
+    now = time.time()
+    
+    # Retrieved nodes first, then previously authorized ones
+    candidates: Dict[str, NodeWithScore] = {}
+    for node in nodes:
+        candidates[node.node.node_id] = node
+    for node_id, node in session.working_set.items():
+        candidates.setdefault(node_id, node)
+    
+    fga_filter = FGAPostprocessor(
+        user_id=session.user_id,
+        request_id=uuid.uuid4().hex,
+        fga_client=fga_client,
+    )
+    
+    documents = []
+    context_nodes = []
+    to_check = []
+    for node in candidates.values():
+        doc_id = str(node.node.ref_doc_id)
+        decision = session.fresh_decision(doc_id, session_store.decision_ttl, now)
+        if decision is None:
+            to_check.append(node)
+        else:
+            # Reused decision: still audited for this turn
+            fga_filter.audit(
+                f"document:{doc_id}",
+                decision.allowed,
+                time.perf_counter(),
+                source="session_cache",
+                decided_at=datetime.fromtimestamp(decision.decided_at, timezone.utc).isoformat(),
+            )
+            documents.append({**decision.result, "cached": True})
+            session.update_working_set(node, decision.allowed, session_store.max_working_set)
+            if decision.allowed:
+                context_nodes.append(node)
+    
+    if to_check:
+        context_nodes.extend(fga_filter.postprocess_nodes(to_check, query_str=question))
+        for node, result in zip(to_check, fga_filter.permission_results):
+            session.remember(result, node, session_store.max_working_set, now)
+        documents.extend(fga_filter.permission_results)
+    
+    prompt = build_prompt(question, context_nodes, history=session.history)
+    # Only prompts that are sent to the LLM count towards prefix reuse
+    prompt_stats = prefix_tracker.record(prompt) if context_nodes else None
+    
+    result = {
+        "session_id": session.session_id,
+        "documents": documents,
+        "allowed_count": sum(1 for doc in documents if doc.get("allowed", False)),
+        "total_count": len(documents),
+        "checked_count": len(to_check),
+        "prompt": prompt_stats,
+        "request_id": fga_filter.request_id,
+    }
+    return (prompt if context_nodes else None), result
+
+async def process_session_turn(
+    session: ChatSession,
+    question: str,
+    fga_client: Optional[SharedFGAClient] = None,
+) -> Dict[str, Any]:
+    """
+    Answer one turn of a chat session.
+
+    Returns the same fields as process_query, plus session_id and
+    checked_count (documents checked against OpenFGA in this turn).
+    """
+    ensure_model_id()
+    async with session.lock:
+        loop = asyncio.get_event_loop()
+        prompt, result = await loop.run_in_executor(
+            None,
+            lambda: _prepare_session_turn(session, question, fga_client)
+        )
+        
+        if prompt is None:
+            answer = "Empty Response"
+        else:
+            response = await Settings.llm.achat(_chat_messages(prompt))
+            answer = response.message.content or ""
+        
+        session.add_turn(question, answer, session_store.history_token_budget)
+        return {"answer": answer, **result}
+
+async def stream_session_turn(
+    session: ChatSession,
+    question: str,
+    fga_client: Optional[SharedFGAClient] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream one turn of a chat session.
+
+    Yields events: {"type": "documents", ...turn result},
+    then {"type": "delta", "text": ...} per token chunk,
+    then {"type": "done", "answer": ...}.
+    """
+    ensure_model_id()
+    async with session.lock:
+        loop = asyncio.get_event_loop()
+        prompt, result = await loop.run_in_executor(
+            None,
+            lambda: _prepare_session_turn(session, question, fga_client)
+        )
+        yield {"type": "documents", **result}
+        
+        if prompt is None:
+            answer = "Empty Response"
+            yield {"type": "delta", "text": answer}
+        else:
+            parts = []
+            stream = await Settings.llm.astream_chat(_chat_messages(prompt))
+            async for chunk in stream:
+                if chunk.delta:
+                    parts.append(chunk.delta)
+                    yield {"type": "delta", "text": chunk.delta}
+            answer = "".join(parts)
+        
+        session.add_turn(question, answer, session_store.history_token_budget)
+        yield {"type": "done", "answer": answer}
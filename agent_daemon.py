@@ -0,0 +1,148 @@
+import os
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+import sys
+import json
+import asyncio
+import socket
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Unix socket the daemon listens on (agent.py connects here)
+AGENT_SOCKET_PATH = os.getenv("AGENT_SOCKET_PATH", "/tmp/llamaindex-fga-agent.sock")
+
+# Generous limit: answering includes an LLM call
+CLIENT_TIMEOUT_SECONDS = float(os.getenv("AGENT_CLIENT_TIMEOUT", "300"))
+
+def daemon_running(socket_path: str = AGENT_SOCKET_PATH) -> bool:
+    """Whether a daemon is accepting connections on socket_path."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except (AttributeError, OSError):
+        return False
+
+def query_daemon(user_id: str, question: str, socket_path: str = AGENT_SOCKET_PATH) -> Optional[Dict[str, Any]]:
+    """
+    Send a query to a running agent daemon.
+
+    Protocol: one JSON object per line in each direction.
+
+    Returns:
+        The process_query() result, or None if no daemon could answer (none
+        listening, socket not accessible, or no reply within
+        AGENT_CLIENT_TIMEOUT seconds).
+    """
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except (AttributeError, OSError):
+        # Platform without Unix sockets
+        return None
+
+    with sock:
+        sock.settimeout(CLIENT_TIMEOUT_SECONDS)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            # Missing or stale socket, or another user's daemon (owner-only socket)
+            return None
+
+        try:
+            request = {"user_id": user_id, "question": question}
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+        except socket.timeout:
+            print(f"Agent daemon on {socket_path} did not answer within {CLIENT_TIMEOUT_SECONDS:g}s "
+                  "(AGENT_CLIENT_TIMEOUT).")
+            return None
+
+    if not line:
+        raise RuntimeError("Agent daemon closed the connection without a response")
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise RuntimeError(f"Agent daemon error: {response.get('error')}")
+    return response["result"]
+
+async def serve(socket_path: str = AGENT_SOCKET_PATH):
+    """
+    Run the agent daemon.
+
+    The vector index, embedding model, LLM settings and a pooled OpenFGA
+    client are loaded once and reused for every query.
+    """
+    # Refuse to take over the socket of a live daemon (checked before the slow startup)
+    if daemon_running(socket_path):
+        print(f"Error: an agent daemon is already listening on {socket_path}.")
+        sys.exit(1)
+
+    # Heavy imports happen here, only in the daemon process
+    from agent_api import SharedFGAClient, get_index, resolve_model_id, process_query
+    from audit import audit_log
+
+    print("Indexing documents...")
+    get_index()
+
+    # Before opening the shared client so it uses the resolved model
+    await resolve_model_id()
+    fga_client = SharedFGAClient().start()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+                result = await process_query(
+                    request["user_id"],
+                    request["question"],
+                    fga_client=fga_client,
+                )
+                response = {"ok": True, "result": result}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    # Remove a stale socket left behind by a previous run (re-checked:
+    # another daemon may have started while we were loading)
+    if daemon_running(socket_path):
+        fga_client.close()
+        print(f"Error: an agent daemon is already listening on {socket_path}.")
+        sys.exit(1)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    # Create the socket owner-only from the start: anyone who can connect
+    # can query as any user_id
+    old_umask = os.umask(0o077)
+    try:
+        server = await asyncio.start_unix_server(handle, path=socket_path)
+    finally:
+        os.umask(old_umask)
+    print(f"Agent daemon listening on {socket_path}")
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        fga_client.close()
+        audit_log.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+def main():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\nAgent daemon stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import asyncio
+import json
 import os
+import time
+import uuid
 from dotenv import load_dotenv
 
-from agent_api import process_query, fga_config
+from agent_api import process_query, process_session_turn, stream_session_turn, fga_config, current_model_id, ensure_model_id, resolve_model_id
+from audit import AuditRecord, audit_log
+from resilient_fga import fga_resilience
+from sessions import session_store
+from http_cache import CachedPayload, PrecompressedStaticFiles, precompress_static, render_index
+import data
 from data import docs_data, USERS, DOC_TO_FOLDER, get_user_by_id, get_profile_image_path
 from openfga_sdk import OpenFgaClient
 from openfga_sdk.client.models import ClientCheckRequest
@@ -16,8 +25,14 @@ load_dotenv()
 
 app = FastAPI(title="Secure AI Agent API")
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Mount static files (served precompressed when the client accepts it)
+try:
+    precompress_static("static")
+    app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
+except OSError as e:
+    # e.g. read-only filesystem: serve the uncompressed files
+    print(f"Could not precompress static files, serving them uncompressed: {e}")
+    app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Request/Response models
 class QueryRequest(BaseModel):
@@ -29,6 +44,22 @@ class QueryResponse(BaseModel):
     documents: List[Dict[str, Any]]
     allowed_count: int
     total_count: int
+    prompt: Optional[Dict[str, Any]] = None
+    request_id: Optional[str] = None
+
+class SessionRequest(BaseModel):
+    user_id: str
+
+class SessionInfo(BaseModel):
+    session_id: str
+    user_id: str
+
+class TurnRequest(BaseModel):
+    question: str
+
+class TurnResponse(QueryResponse):
+    session_id: str
+    checked_count: int
 
 class UserInfo(BaseModel):
     id: str
@@ -44,6 +75,10 @@ class DocumentInfo(BaseModel):
     lang: str
     folder: str
 
+class BootstrapInfo(BaseModel):
+    users: List[UserInfo]
+    documents: List[DocumentInfo]
+
 class PermissionInfo(BaseModel):
     user_id: str
     accessible_documents: List[Dict[str, str]]
@@ -51,10 +86,23 @@ class PermissionInfo(BaseModel):
 
 # All data is now imported from data.py (Single Source of Truth)
 
+@app.on_event("startup")
+async def startup():
+    """Resolve the authorization model recorded in audit records."""
+    await resolve_model_id()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush buffered audit records."""
+    await asyncio.get_event_loop().run_in_executor(None, audit_log.close)
+
+# index.html with versioned asset URLs, built once at startup
+_index_page = render_index("static")
+
 @app.get("/")
-async def read_root():
+async def read_root(request: Request):
     """Serve the main HTML page."""
-    return FileResponse("static/index.html")
+    return _index_page.response(request)
 
 @app.post("/api/query", response_model=QueryResponse)
 async def query_endpoint(request: QueryRequest):
@@ -67,11 +115,59 @@ async def query_endpoint(request: QueryRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/users", response_model=List[UserInfo])
-async def get_users():
+@app.post("/api/sessions", response_model=SessionInfo)
+async def create_session(request: SessionRequest):
     """
-    Get list of all users.
+    Create a chat session for a user.
+    """
+    if not get_user_by_id(request.user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    session = session_store.create(request.user_id)
+    return SessionInfo(session_id=session.session_id, user_id=session.user_id)
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """
+    End a chat session.
+    """
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": True}
+
+@app.post("/api/sessions/{session_id}/turns", response_model=TurnResponse)
+async def session_turn(session_id: str, request: TurnRequest):
+    """
+    Ask a question within a chat session.
+    """
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        result = await process_session_turn(session, request.question)
+        return TurnResponse(**result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/sessions/{session_id}/turns/stream")
+async def session_turn_stream(session_id: str, request: TurnRequest):
+    """
+    Ask a question within a chat session and stream the reply as
+    newline-delimited JSON events (documents, delta..., done).
     """
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    async def events():
+        try:
+            async for event in stream_session_turn(session, request.question):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+def _build_users() -> List[UserInfo]:
     users_with_images = []
     for user in USERS:
         user_dict = user.copy()
@@ -79,11 +175,7 @@ async def get_users():
         users_with_images.append(UserInfo(**user_dict))
     return users_with_images
 
-@app.get("/api/documents", response_model=List[DocumentInfo])
-async def get_documents():
-    """
-    Get list of all documents.
-    """
+def _build_documents() -> List[DocumentInfo]:
     documents = []
     for doc in docs_data:
         doc_id = doc["id"]
@@ -97,6 +189,46 @@ async def get_documents():
         ))
     return documents
 
+# Serialized catalog responses, rebuilt only when data.DATA_VERSION changes
+_catalog: Dict[str, CachedPayload] = {}
+_catalog_version: Optional[int] = None
+
+def get_catalog() -> Dict[str, CachedPayload]:
+    global _catalog, _catalog_version
+    if _catalog_version != data.DATA_VERSION:
+        users = jsonable_encoder(_build_users())
+        documents = jsonable_encoder(_build_documents())
+        _catalog = {
+            "users": CachedPayload(json.dumps(users, ensure_ascii=False).encode("utf-8")),
+            "documents": CachedPayload(json.dumps(documents, ensure_ascii=False).encode("utf-8")),
+            "bootstrap": CachedPayload(json.dumps(
+                {"users": users, "documents": documents}, ensure_ascii=False
+            ).encode("utf-8")),
+        }
+        _catalog_version = data.DATA_VERSION
+    return _catalog
+
+@app.get("/api/bootstrap", response_model=BootstrapInfo)
+async def get_bootstrap(request: Request):
+    """
+    Get users and documents in a single (cacheable) response.
+    """
+    return get_catalog()["bootstrap"].response(request)
+
+@app.get("/api/users", response_model=List[UserInfo])
+async def get_users(request: Request):
+    """
+    Get list of all users.
+    """
+    return get_catalog()["users"].response(request)
+
+@app.get("/api/documents", response_model=List[DocumentInfo])
+async def get_documents(request: Request):
+    """
+    Get list of all documents.
+    """
+    return get_catalog()["documents"].response(request)
+
 @app.get("/api/permissions/{user_id}", response_model=PermissionInfo)
 async def get_permissions(user_id: str):
     """
@@ -108,21 +240,35 @@ async def get_permissions(user_id: str):
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check permissions for each document using OpenFGA
+    ensure_model_id()
     accessible_documents = []
+    request_id = uuid.uuid4().hex
     
     async with OpenFgaClient(fga_config) as client:
         for doc in docs_data:
             doc_id = doc["id"]
             object_str = f"document:{doc_id}"
             
+            started = time.perf_counter()
             try:
-                response = await client.check(
-                    body=ClientCheckRequest(
+                response = await fga_resilience.check(
+                    client,
+                    ClientCheckRequest(
                         user=user_id,
                         relation="viewer",
                         object=object_str
                     )
                 )
+                audit_log.record(AuditRecord(
+                    user=user_id,
+                    object=object_str,
+                    relation="viewer",
+                    allowed=response.allowed,
+                    model_id=current_model_id(),
+                    latency_ms=(time.perf_counter() - started) * 1000,
+                    request_id=request_id,
+                    source="permissions",
+                ))
                 
                 if response.allowed:
                     folder = DOC_TO_FOLDER.get(doc_id, "unknown")
@@ -132,8 +278,18 @@ async def get_permissions(user_id: str):
                         "folder": folder
                     })
             except Exception as e:
-                # Log error but continue processing other documents
-                print(f"Error checking permission for {object_str}: {e}")
+                # Record error (denied) but continue processing other documents
+                audit_log.record(AuditRecord(
+                    user=user_id,
+                    object=object_str,
+                    relation="viewer",
+                    allowed=False,
+                    model_id=current_model_id(),
+                    latency_ms=(time.perf_counter() - started) * 1000,
+                    request_id=request_id,
+                    source="permissions",
+                    error=str(e) or type(e).__name__,
+                ))
                 continue
     
     return PermissionInfo(
@@ -142,6 +298,17 @@ async def get_permissions(user_id: str):
         groups=user["groups"]
     )
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """
+    Get internal counters (audit log, chat sessions, OpenFGA checks and circuit breaker).
+    """
+    return {
+        "audit": audit_log.stats(),
+        "sessions": session_store.stats(),
+        "fga": fga_resilience.stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
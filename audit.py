@@ -0,0 +1,228 @@
+"""
+Asynchronous, batched authorization audit log.
+
+Request handlers only append a record to a bounded in-memory ring buffer;
+a background thread flushes the buffer in batches to rotating, gzip
+compressed JSONL files. Handlers never wait for disk I/O: when the buffer is
+full, records are dropped according to the configured policy and counted.
+"""
+import os
+import json
+import gzip
+import time
+import atexit
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+@dataclass
+class AuditRecord:
+    """One authorization decision."""
+    user: str
+    object: str
+    relation: str
+    allowed: bool
+    model_id: Optional[str]
+    latency_ms: float
+    request_id: Optional[str] = None
+    source: str = "query"
+    error: Optional[str] = None
+    # For decisions reused from a cache: when the decision was originally made
+    decided_at: Optional[str] = None
+    timestamp: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+
+class AuditLog:
+    """Bounded ring buffer with a background batch writer."""
+
+    def __init__(
+        self,
+        directory: str = "audit_logs",
+        buffer_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_file_bytes: int = 10 * 1024 * 1024,
+        max_files: int = 10,
+        drop_policy: str = DROP_OLDEST,
+        enabled: bool = True,
+    ):
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown audit drop policy: {drop_policy}")
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.drop_policy = drop_policy
+        self.enabled = enabled
+
+        self._buffer: Deque[AuditRecord] = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._current_path: Optional[str] = None
+
+        self.counters = {
+            "recorded": 0,
+            "dropped": 0,
+            "written": 0,
+            "batches": 0,
+            "files_created": 0,
+            "write_errors": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "AuditLog":
+        """Create an audit log configured from AUDIT_* environment variables."""
+        return cls(
+            directory=os.getenv("AUDIT_LOG_DIR", "audit_logs"),
+            buffer_size=int(os.getenv("AUDIT_BUFFER_SIZE", "10000")),
+            batch_size=int(os.getenv("AUDIT_BATCH_SIZE", "500")),
+            flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0")),
+            max_file_bytes=int(os.getenv("AUDIT_MAX_FILE_BYTES", str(10 * 1024 * 1024))),
+            max_files=int(os.getenv("AUDIT_MAX_FILES", "10")),
+            drop_policy=os.getenv("AUDIT_DROP_POLICY", DROP_OLDEST),
+            enabled=os.getenv("AUDIT_ENABLED", "true").lower() not in ("0", "false", "no"),
+        )
+
+    # --- Hot path -------------------------------------------------------
+
+    def record(self, record: AuditRecord):
+        """Queue a decision record. Never blocks on I/O."""
+        if not self.enabled:
+            return
+        self._ensure_started()
+
+        with self._lock:
+            self.counters["recorded"] += 1
+            if self._stopping.is_set():
+                # Writer already stopped: the record would never be written
+                self.counters["dropped"] += 1
+                return
+            if len(self._buffer) == self._buffer.maxlen:
+                self.counters["dropped"] += 1
+                if self.drop_policy == DROP_NEWEST:
+                    return
+                # DROP_OLDEST: deque(maxlen) evicts the oldest on append
+            self._buffer.append(record)
+            pending = len(self._buffer)
+
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for metrics endpoints."""
+        with self._lock:
+            return {
+                **self.counters,
+                "buffered": len(self._buffer),
+                "capacity": self._buffer.maxlen,
+                "drop_policy": self.drop_policy,
+                "enabled": self.enabled,
+            }
+
+    # --- Background writer ----------------------------------------------
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+        # Final flush on shutdown
+        self._drain()
+
+    def _take_batch(self) -> List[AuditRecord]:
+        with self._lock:
+            count = min(self.batch_size, len(self._buffer))
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def _drain(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                with self._lock:
+                    self.counters["write_errors"] += 1
+                    self.counters["dropped"] += len(batch)
+                print(f"[Audit] Failed to write {len(batch)} records: {e}")
+                return
+
+    def _write_batch(self, batch: List[AuditRecord]):
+        payload = "".join(json.dumps(asdict(r), ensure_ascii=False) + "\n" for r in batch).encode("utf-8")
+
+        # max_file_bytes limits the compressed size on disk
+        if (
+            self._current_path is None
+            or not os.path.exists(self._current_path)
+            or os.path.getsize(self._current_path) >= self.max_file_bytes
+        ):
+            self._rotate()
+
+        # Each batch is appended as its own gzip member; gzip readers
+        # transparently concatenate members.
+        with gzip.open(self._current_path, "ab") as f:
+            f.write(payload)
+
+        with self._lock:
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+
+    def _rotate(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        self._current_path = os.path.join(self.directory, f"audit-{stamp}.jsonl.gz")
+        with self._lock:
+            self.counters["files_created"] += 1
+
+        # Keep only the newest max_files files (including the new one)
+        files = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith("audit-") and name.endswith(".jsonl.gz")
+        )
+        while self.max_files > 0 and len(files) >= self.max_files:
+            try:
+                os.remove(os.path.join(self.directory, files.pop(0)))
+            except OSError:
+                pass
+
+    def flush(self, timeout: float = 5.0):
+        """Ask the writer to flush now and wait (up to timeout) for the buffer to empty."""
+        if self._thread is None:
+            return
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._buffer:
+                    return
+            time.sleep(0.01)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the writer after flushing buffered records."""
+        if self._thread is None or self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+# Process-wide audit log
+audit_log = AuditLog.from_env()
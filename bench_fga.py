@@ -0,0 +1,116 @@
+"""
+Benchmark plain vs. resilient OpenFGA checks against fake_fga_server.py.
+
+Starts the fake server in-process, injects latency spikes and an outage, and
+reports per-query latency (all documents checked for one user) for:
+
+- plain:     client.check() for each document, as before (SDK retries)
+- resilient: fga_resilience-style checks (deadline, hedging, circuit
+             breaker) on a client without SDK retries, like agent_api.fga_config
+
+Usage:
+    python bench_fga.py [--queries 1000] [--spike-probability 0.02] [--spike-ms 300]
+"""
+import time
+import asyncio
+import argparse
+import threading
+from typing import Awaitable, Callable, List
+
+import uvicorn
+from openfga_sdk import ClientConfiguration, OpenFgaClient
+from openfga_sdk.configuration import RetryParams
+from openfga_sdk.client.models import ClientCheckRequest
+
+import fake_fga_server
+from data import USERS, docs_data
+from resilient_fga import ResilientChecker
+
+PORT = 8089
+# Any well-formed ULID; the fake server ignores it
+STORE_ID = "01HVMMBCMGZNT3SED4Z17ECXCA"
+
+def start_fake_server() -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(fake_fga_server.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+def report(label: str, samples: List[float]) -> float:
+    """Print latency percentiles; returns p99 in ms."""
+    print(
+        f"  {label:<10} p50={percentile(samples, 50) * 1000:8.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:8.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.1f}ms "
+        f"max={max(samples) * 1000:8.1f}ms"
+    )
+    return percentile(samples, 99) * 1000
+
+async def run_queries(
+    client: OpenFgaClient,
+    check: Callable[[ClientCheckRequest], Awaitable[object]],
+    queries: int,
+) -> List[float]:
+    """Time `queries` queries, each checking every document concurrently."""
+    latencies = []
+    for i in range(queries):
+        user = USERS[i % len(USERS)]["id"]
+        started = time.perf_counter()
+
+        async def one(doc_id: str):
+            try:
+                await check(ClientCheckRequest(user=user, relation="viewer", object=f"document:{doc_id}"))
+            except Exception:
+                pass  # Fail closed
+
+        await asyncio.gather(*(one(doc["id"]) for doc in docs_data))
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark resilient OpenFGA checks")
+    # p99 of a few hundred queries is just the 2nd-3rd slowest one
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--spike-probability", type=float, default=0.02)
+    parser.add_argument("--spike-ms", type=float, default=300)
+    parser.add_argument("--outage-queries", type=int, default=20)
+    args = parser.parse_args()
+
+    start_fake_server()
+    api_url = f"http://127.0.0.1:{PORT}"
+    plain_config = ClientConfiguration(api_url=api_url, store_id=STORE_ID)
+    resilient_config = ClientConfiguration(api_url=api_url, store_id=STORE_ID, retry_params=RetryParams(max_retry=0))
+
+    async with OpenFgaClient(plain_config) as client, OpenFgaClient(resilient_config) as resilient_client:
+        checker = ResilientChecker(timeout=1.0)
+
+        async def plain(body):
+            return await client.check(body=body)
+
+        async def resilient(body):
+            return await checker.check(resilient_client, body)
+
+        print(f"Latency spikes: {args.spike_probability:.0%} of checks +{args.spike_ms:.0f}ms, "
+              f"{len(docs_data)} checks per query, {args.queries} queries")
+        fake_fga_server.faults = fake_fga_server.Faults(
+            spike_probability=args.spike_probability, spike_ms=args.spike_ms, outage=None)
+        # Warm up connections and the hedge delay estimate
+        await run_queries(client, resilient, 10)
+        plain_p99 = report("plain", await run_queries(client, plain, args.queries))
+        resilient_p99 = report("resilient", await run_queries(client, resilient, args.queries))
+        print(f"  p99: {plain_p99:.1f}ms -> {resilient_p99:.1f}ms")
+        print(f"  resilient stats: {checker.stats()}")
+
+        print(f"\nOutage (HTTP 503), {args.outage_queries} queries")
+        fake_fga_server.faults = fake_fga_server.Faults(outage="error")
+        report("plain", await run_queries(client, plain, args.outage_queries))
+        report("resilient", await run_queries(client, resilient, args.outage_queries))
+        print(f"  breaker: {checker.breaker.stats()}, short-circuited: {checker.counters['short_circuited']}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
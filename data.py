@@ -141,12 +141,24 @@ PROFILE_IMAGE_MAP = {
     "tsukioka": "tsukioka.png",
 }
 
+# Lookup index (rebuilt by mark_data_changed)
+USERS_BY_ID = {u["id"]: u for u in USERS}
+
+# Bumped whenever the data above changes; API caches are keyed on it
+DATA_VERSION = 0
+
+def mark_data_changed():
+    """Call after modifying USERS / docs_data / DOC_TO_FOLDER to refresh indexes and caches."""
+    global USERS_BY_ID, DATA_VERSION
+    USERS_BY_ID = {u["id"]: u for u in USERS}
+    DATA_VERSION += 1
+
 def get_documents():
     return [Document(text=d["text"], metadata=d["metadata"], doc_id=d["id"]) for d in docs_data]
 
 def get_user_by_id(user_id: str):
     """Get user information by user ID."""
-    return next((u for u in USERS if u["id"] == user_id), None)
+    return USERS_BY_ID.get(user_id)
 
 def get_profile_image_path(user_id: str) -> str:
     """Get profile image path from user ID."""
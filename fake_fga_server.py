@@ -0,0 +1,100 @@
+"""
+Fake OpenFGA server with injectable latency spikes and outages.
+
+Implements just the Check API, answering from the same permission model as
+fga_setup.py, so the resilient check layer (resilient_fga.py) can be
+exercised without Docker. Faults are configured via FAKE_FGA_* environment
+variables or at runtime:
+
+    curl -X POST localhost:8080/admin/faults -H 'Content-Type: application/json' \\
+         -d '{"spike_probability": 0.05, "spike_ms": 800, "outage": "error"}'
+
+outage: null (healthy), "error" (HTTP 503) or "hang" (never answers).
+"""
+import os
+import random
+import asyncio
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import ClientDisconnect
+from pydantic import BaseModel
+
+from data import DOC_TO_FOLDER, get_user_by_id
+
+# Same folder -> viewer groups as fga_setup.py
+FOLDER_VIEWER_GROUPS = {
+    "engineering": {"engineering", "se", "product"},
+    "sales": {"sales"},
+    "product": {"product", "sales"},
+    "corporate": {"corporate"},
+    "scpm": {"scpm"},
+    "general": {"engineering", "se", "sales", "product", "corporate", "scpm"},
+    "executive": set(),
+}
+# Direct folder viewers
+FOLDER_VIEWER_USERS = {
+    "executive": {"user:seigen"},
+}
+
+class Faults(BaseModel):
+    base_ms: float = float(os.getenv("FAKE_FGA_BASE_MS", "2"))
+    spike_probability: float = float(os.getenv("FAKE_FGA_SPIKE_PROBABILITY", "0"))
+    spike_ms: float = float(os.getenv("FAKE_FGA_SPIKE_MS", "500"))
+    outage: Optional[str] = os.getenv("FAKE_FGA_OUTAGE") or None
+
+app = FastAPI(title="Fake OpenFGA")
+faults = Faults()
+stats = {"checks": 0, "spikes": 0, "outage_responses": 0}
+
+def is_viewer(user: str, obj: str) -> bool:
+    if not obj.startswith("document:"):
+        return False
+    folder = DOC_TO_FOLDER.get(obj[len("document:"):])
+    if folder is None:
+        return False
+    if user in FOLDER_VIEWER_USERS.get(folder, set()):
+        return True
+    user_data = get_user_by_id(user)
+    groups = set(user_data["groups"]) if user_data else set()
+    return bool(groups & FOLDER_VIEWER_GROUPS.get(folder, set()))
+
+@app.post("/stores/{store_id}/check")
+async def check(store_id: str, request: Request):
+    stats["checks"] += 1
+    # Read the body first: a hedged duplicate may be cancelled while we sleep
+    try:
+        body = await request.json()
+    except ClientDisconnect:
+        return Response(status_code=499)
+    if faults.outage == "hang":
+        stats["outage_responses"] += 1
+        await asyncio.Event().wait()
+    if faults.outage == "error":
+        stats["outage_responses"] += 1
+        return JSONResponse(status_code=503, content={"code": "unavailable", "message": "injected outage"})
+
+    delay_ms = faults.base_ms
+    if random.random() < faults.spike_probability:
+        stats["spikes"] += 1
+        delay_ms += faults.spike_ms
+    await asyncio.sleep(delay_ms / 1000)
+
+    tuple_key = body.get("tuple_key", {})
+    allowed = tuple_key.get("relation") == "viewer" and is_viewer(tuple_key.get("user", ""), tuple_key.get("object", ""))
+    return {"allowed": allowed, "resolution": ""}
+
+@app.get("/admin/faults")
+async def get_faults() -> Dict[str, Any]:
+    return {**faults.model_dump(), "stats": stats}
+
+@app.post("/admin/faults")
+async def set_faults(new_faults: Faults) -> Dict[str, Any]:
+    global faults
+    faults = new_faults
+    return faults.model_dump()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("FAKE_FGA_PORT", "8080")))
@@ -0,0 +1,113 @@
+"""
+Fake OpenAI-compatible LLM server that simulates prompt-prefix (KV) caching.
+
+Used to measure how much prefill the deterministic prompt layout saves
+without a real model. Like llama.cpp / LM Studio it keeps a few recent
+prompts in "slots" and only pays prefill for the part of a new prompt that
+does not match the longest cached prefix.
+
+Usage:
+    uvicorn fake_llm_server:app --port 1234
+    LLM_API_BASE=http://127.0.0.1:1234/v1 uvicorn api:app --port 8000
+    curl http://127.0.0.1:1234/v1/stats
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+
+# Rough token estimate: 1 token ~ 4 characters
+CHARS_PER_TOKEN = 4
+# Simulated prefill cost per uncached prompt token
+PREFILL_SECONDS_PER_TOKEN = float(os.getenv("FAKE_LLM_PREFILL_MS_PER_TOKEN", "2")) / 1000
+# Number of cached prompts (llama.cpp "slots")
+CACHE_SLOTS = int(os.getenv("FAKE_LLM_CACHE_SLOTS", "4"))
+
+app = FastAPI(title="Fake LLM (prefix cache simulator)")
+
+_cache: "OrderedDict[str, str]" = OrderedDict()
+_stats = {
+    "requests": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+    "prefill_seconds": 0.0,
+}
+
+def _render(messages: List[Dict[str, Any]]) -> str:
+    """Flatten chat messages the way a chat template would."""
+    return "".join(f"<|{m.get('role', 'user')}|>\n{m.get('content') or ''}\n" for m in messages)
+
+def _cached_prefix_length(prompt: str) -> int:
+    best = 0
+    for previous in _cache.values():
+        n = min(len(prompt), len(previous))
+        i = 0
+        while i < n and prompt[i] == previous[i]:
+            i += 1
+        best = max(best, i)
+    return best
+
+def _remember(prompt: str):
+    _cache[prompt] = prompt
+    _cache.move_to_end(prompt)
+    while len(_cache) > CACHE_SLOTS:
+        _cache.popitem(last=False)
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = _render(body.get("messages", []))
+
+    prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+    cached_tokens = _cached_prefix_length(prompt) // CHARS_PER_TOKEN
+    _remember(prompt)
+
+    prefill = (prompt_tokens - cached_tokens) * PREFILL_SECONDS_PER_TOKEN
+    await asyncio.sleep(prefill)
+
+    _stats["requests"] += 1
+    _stats["prompt_tokens"] += prompt_tokens
+    _stats["cached_tokens"] += cached_tokens
+    _stats["prefill_seconds"] += prefill
+
+    content = (
+        f"[fake-llm] {prompt_tokens} prompt tokens, {cached_tokens} served from prefix cache."
+    )
+    return {
+        "id": f"chatcmpl-fake-{_stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // CHARS_PER_TOKEN,
+            "total_tokens": prompt_tokens + len(content) // CHARS_PER_TOKEN,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+
+@app.get("/v1/stats")
+async def stats():
+    """Cumulative prefix cache statistics."""
+    hit_rate = _stats["cached_tokens"] / _stats["prompt_tokens"] if _stats["prompt_tokens"] else 0.0
+    return {**_stats, "cache_hit_rate": round(hit_rate, 4)}
+
+@app.post("/v1/stats/reset")
+async def reset_stats():
+    _cache.clear()
+    for key in _stats:
+        _stats[key] = 0
+    _stats["prefill_seconds"] = 0.0
+    return {"ok": True}
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("FAKE_LLM_PORT", "1234")))
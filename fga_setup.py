@@ -145,7 +145,8 @@ async def main():
         
         print("\n--- Setup Complete ---")
         print(f"export FGA_STORE_ID={store_id}")
-        print("Please set this environment variable before running the agent.")
+        print(f"export FGA_MODEL_ID={model_id}")
+        print("Please set FGA_STORE_ID (and optionally FGA_MODEL_ID) before running the agent.")
 
 if __name__ == "__main__":
     asyncio.run(main())
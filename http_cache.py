@@ -0,0 +1,166 @@
+"""
+HTTP caching helpers for the web UI.
+
+- CachedPayload: a response body serialized and compressed once, served
+  with an ETag (304 on If-None-Match) and the best Accept-Encoding.
+- precompress_static(): writes .gz / .br siblings next to text assets.
+- PrecompressedStaticFiles: StaticFiles that serves those siblings and sets
+  long-lived cache headers for versioned (?v=...) URLs.
+- render_index(): index.html with ?v=<content hash> added to local assets.
+"""
+import os
+import re
+import gzip
+import stat
+import hashlib
+from typing import Optional
+from urllib.parse import parse_qs
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # Optional: fall back to gzip only
+    brotli = None
+
+# Text assets worth compressing (images are already compressed)
+COMPRESSIBLE_EXTENSIONS = {".html", ".css", ".js", ".json", ".svg", ".txt"}
+# Suffixes of the files written by precompress_static()
+PRECOMPRESSED_SUFFIXES = {".gz", ".br"}
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+def _accepts(request_headers: Headers, encoding: str) -> bool:
+    """Whether Accept-Encoding allows encoding (an explicit q=0 refuses it)."""
+    for part in request_headers.get("accept-encoding", "").split(","):
+        name, *params = [item.strip() for item in part.split(";")]
+        if name.lower() != encoding:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+class CachedPayload:
+    """A response body that is serialized, hashed and compressed only once."""
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.body = body
+        self.media_type = media_type
+        self.etag = _etag(body)
+        self.gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+        self.br_body = brotli.compress(body) if brotli is not None else None
+
+    def response(self, request: Request, cache_control: str = CACHE_REVALIDATE) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        body = self.body
+        if self.br_body is not None and _accepts(request.headers, "br"):
+            body = self.br_body
+            headers["Content-Encoding"] = "br"
+        elif _accepts(request.headers, "gzip"):
+            body = self.gzip_body
+            headers["Content-Encoding"] = "gzip"
+        return Response(content=body, media_type=self.media_type, headers=headers)
+
+def precompress_static(directory: str):
+    """
+    Write .gz (and .br if brotli is installed) siblings for text assets that
+    are missing or stale. Raises OSError if the directory is not writable.
+    """
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            source_mtime = os.path.getmtime(path)
+
+            targets = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                targets.append((".br", brotli.compress))
+
+            data = None
+            for suffix, compress in targets:
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+                    continue
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                with open(target, "wb") as f:
+                    f.write(compress(data))
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that prefers precompressed .br/.gz files and sets cache headers."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        response: Optional[Response] = None
+
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        # The .gz/.br siblings are only served as an encoding of their source
+        # file; fetched directly they would carry the source's Content-Type
+        if os.path.splitext(path)[1] in PRECOMPRESSED_SUFFIXES:
+            raise HTTPException(status_code=404)
+
+        if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+            for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                if not _accepts(request_headers, encoding):
+                    continue
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+                if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+                    # Content-Type is guessed from the name without the .br/.gz suffix
+                    response = self.file_response(full_path, stat_result, scope)
+                    response.headers["Content-Encoding"] = encoding
+                    break
+
+        if response is None:
+            response = await super().get_response(path, scope)
+
+        response.headers["Vary"] = "Accept-Encoding"
+        if response.status_code in (200, 304):
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            versioned = bool(query.get("v"))
+            response.headers["Cache-Control"] = CACHE_IMMUTABLE if versioned else CACHE_REVALIDATE
+        return response
+
+def asset_version(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+_ASSET_URL = re.compile(r'((?:href|src)=")/static/([^"?]+)(")')
+
+def render_index(static_dir: str = "static") -> CachedPayload:
+    """index.html with cache-busting ?v=<hash> on local CSS/JS references."""
+    with open(os.path.join(static_dir, "index.html"), "r", encoding="utf-8") as f:
+        html = f.read()
+
+    def versioned(match: "re.Match[str]") -> str:
+        asset = match.group(2)
+        asset_path = os.path.join(static_dir, asset)
+        if not os.path.isfile(asset_path):
+            return match.group(0)
+        return f"{match.group(1)}/static/{asset}?v={asset_version(asset_path)}{match.group(3)}"
+
+    return CachedPayload(_ASSET_URL.sub(versioned, html).encode("utf-8"), media_type="text/html; charset=utf-8")
@@ -0,0 +1,139 @@
+"""
+Deterministic prompt assembly for the local LLM.
+
+Local servers such as LM Studio and llama.cpp reuse the KV cache for the
+longest prompt prefix they have already processed. To make that prefix as
+long as possible the prompt is always laid out as:
+
+    1. a fixed system/instruction prefix
+    2. the allowed context chunks, in canonical document-ID order
+    3. the conversation history (chat sessions only)
+    4. the question
+
+The context is the top retrieved chunks the user may see, so it changes
+with the question. Canonical ordering only guarantees that whenever the same
+set of allowed chunks is retrieved again (same or similar questions, users
+with overlapping permissions), the prompt is byte-identical up to the
+question regardless of retrieval scores and order. The fixed system prefix
+is shared by every request.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+SYSTEM_PROMPT = (
+    "You are an assistant that answers questions about internal company documents. "
+    "Answer using only the context information provided. "
+    "If the context does not contain the answer, say that you don't know. "
+    "Never mention documents that are not in the context."
+)
+
+CONTEXT_HEADER = "Context information is below.\n---------------------\n"
+CONTEXT_FOOTER = (
+    "\n---------------------\n"
+    "Given the context information and not prior knowledge, answer the query.\n"
+)
+HISTORY_HEADER = "Conversation so far:\n"
+QUESTION_TEMPLATE = "Query: {question}\nAnswer: "
+
+@dataclass
+class BuiltPrompt:
+    """A prompt split into its cacheable prefix and the per-request question."""
+    system: str
+    user: str
+    # Everything before the question (system + context): identical for
+    # every request that retrieves the same set of allowed chunks.
+    prefix: str
+    doc_ids: List[str]
+
+    @property
+    def prefix_hash(self) -> str:
+        return hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:16]
+
+def _doc_sort_key(node: Any) -> Tuple[Any, ...]:
+    """Canonical order: document ID (numeric-aware), then chunk position."""
+    doc_id = str(node.node.ref_doc_id)
+    start = getattr(node.node, "start_char_idx", None) or 0
+    if doc_id.isdigit():
+        return (0, int(doc_id), "", start)
+    return (1, 0, doc_id, start)
+
+def _format_chunk(node: Any) -> str:
+    doc_id = node.node.ref_doc_id
+    metadata = node.node.metadata or {}
+    title = metadata.get("title", f"Document {doc_id}")
+    return f"[document:{doc_id}] {title}\n{node.node.get_content()}"
+
+def build_prompt(
+    question: str,
+    nodes: Sequence[Any],
+    history: Optional[Sequence[Tuple[str, str]]] = None,
+) -> BuiltPrompt:
+    """
+    Build the prompt for the given question and (already authorized) nodes.
+
+    history: optional (role, content) pairs, placed after the context so the
+    cacheable prefix does not depend on the conversation.
+    """
+    ordered = sorted(nodes, key=_doc_sort_key)
+    context = "\n\n".join(_format_chunk(node) for node in ordered)
+    context_block = CONTEXT_HEADER + context + CONTEXT_FOOTER
+    history_block = ""
+    if history:
+        history_block = HISTORY_HEADER + "".join(
+            f"{role.capitalize()}: {content}\n" for role, content in history
+        )
+    user = context_block + history_block + QUESTION_TEMPLATE.format(question=question)
+
+    return BuiltPrompt(
+        system=SYSTEM_PROMPT,
+        user=user,
+        prefix=SYSTEM_PROMPT + "\n" + context_block,
+        doc_ids=[str(node.node.ref_doc_id) for node in ordered],
+    )
+
+def _common_prefix_length(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+class PrefixTracker:
+    """
+    Remembers recent prompts and reports how much of a new prompt's prefix
+    was already sent before, i.e. how much prefill a prefix cache can skip.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self._max_entries = max_entries
+        self._prompts: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, prompt: BuiltPrompt) -> Dict[str, Any]:
+        """Record a prompt and return its prefix statistics."""
+        text = prompt.system + "\n" + prompt.user
+        with self._lock:
+            shared = max(
+                (_common_prefix_length(text, previous) for previous in self._prompts.values()),
+                default=0,
+            )
+            # Never report more than the cacheable prefix itself
+            shared = min(shared, len(prompt.prefix))
+
+            self._prompts[text] = text
+            self._prompts.move_to_end(text)
+            while len(self._prompts) > self._max_entries:
+                self._prompts.popitem(last=False)
+
+        return {
+            "prefix_length": len(prompt.prefix),
+            "shared_prefix_length": shared,
+            "prefix_hash": prompt.prefix_hash,
+            "context_doc_ids": prompt.doc_ids,
+        }
+
+# Process-wide tracker used by process_query
+prefix_tracker = PrefixTracker()
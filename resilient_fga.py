@@ -0,0 +1,320 @@
+"""
+Resilient OpenFGA checks: per-call deadlines, hedged requests and a circuit
+breaker.
+
+- Every check has a deadline (FGA_CHECK_TIMEOUT) instead of the SDK default.
+- If a check has not answered after the recent p95 latency, a duplicate
+  request is sent and whichever answers first wins. Hedges are paid for
+  from a token bucket: every check adds FGA_MAX_HEDGE_RATIO tokens (up to
+  FGA_HEDGE_BURST) and every hedge spends one. A query's concurrent checks
+  can therefore all be hedged during a latency spike, while over time at
+  most FGA_MAX_HEDGE_RATIO of checks are hedged, so a general slowdown does
+  not double the load on OpenFGA.
+- When the recent error rate crosses a threshold the circuit opens and
+  checks fail closed immediately (treated as denied by the callers) until a
+  probe request succeeds again. Only timeouts, transport errors and
+  5xx/429 responses count as failures; other 4xx responses are caused by
+  the request itself and are re-raised without affecting the breaker.
+"""
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OpenFGA while the circuit is open."""
+
+class Ticket(NamedTuple):
+    """Admission of one call: the breaker generation it was admitted in and
+    whether it is the half-open probe."""
+    generation: int
+    probe: bool
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        window: int = 50,
+        min_calls: int = 10,
+        reset_timeout: float = 5.0,
+    ):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_count = 0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        # Bumped on every state change; outcomes of calls admitted in an
+        # earlier generation (stragglers) are ignored
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> Optional[Ticket]:
+        """Admit a call to OpenFGA; returns None while the circuit is open."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return None
+                # Let a single probe through
+                self._transition(self.HALF_OPEN)
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return None
+                self._probe_in_flight = True
+                return Ticket(self._generation, probe=True)
+            return Ticket(self._generation, probe=False)
+
+    def release(self, ticket: Ticket):
+        """Give back an admission without recording an outcome (call
+        cancelled, or failed with a client error)."""
+        with self._lock:
+            if ticket.probe and ticket.generation == self._generation:
+                self._probe_in_flight = False
+
+    def record(self, ticket: Ticket, ok: bool):
+        """Record the outcome of an admitted call."""
+        with self._lock:
+            if ticket.generation != self._generation:
+                return
+            if self.state == self.HALF_OPEN:
+                # Only the probe is admitted in this generation
+                self._probe_in_flight = False
+                if ok:
+                    self._transition(self.CLOSED)
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(ok)
+            if len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for outcome in self._outcomes if not outcome)
+                if failures / len(self._outcomes) >= self.failure_threshold:
+                    self._open()
+
+    def _transition(self, state: str):
+        self.state = state
+        self._generation += 1
+        self._outcomes.clear()
+
+    def _open(self):
+        self._transition(self.OPEN)
+        self.opened_count += 1
+        self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            failures = sum(1 for outcome in self._outcomes if not outcome)
+            return {
+                "state": self.state,
+                "opened_count": self.opened_count,
+                "window_calls": len(self._outcomes),
+                "window_error_rate": round(failures / len(self._outcomes), 4) if self._outcomes else 0.0,
+            }
+
+class LatencyTracker:
+    """Rolling window of latencies (seconds) for percentile estimates."""
+
+    def __init__(self, window: int = 500):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q / 100 * len(ordered)))
+        return ordered[index]
+
+def is_client_error(error: BaseException) -> bool:
+    """
+    Whether an SDK error was caused by the request itself (4xx other than
+    429). Such errors say nothing about OpenFGA's health.
+    """
+    status = getattr(error, "status", None)
+    return isinstance(status, int) and 400 <= status < 500 and status != 429
+
+class ResilientChecker:
+    """Wraps OpenFgaClient.check() with a deadline, hedging and a circuit breaker."""
+
+    def __init__(
+        self,
+        timeout: float = 1.0,
+        hedging: bool = True,
+        initial_hedge_delay: float = 0.05,
+        min_hedge_delay: float = 0.005,
+        hedge_percentile: float = 95.0,
+        min_samples: int = 20,
+        max_hedge_ratio: float = 0.1,
+        hedge_burst: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.timeout = timeout
+        self.hedging = hedging
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.hedge_burst = hedge_burst
+        # Hedge budget (token bucket), starts full
+        self._hedge_tokens = float(hedge_burst)
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "hedges_suppressed": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "client_errors": 0,
+            "short_circuited": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "ResilientChecker":
+        """Create a checker configured from FGA_* environment variables."""
+        return cls(
+            timeout=float(os.getenv("FGA_CHECK_TIMEOUT", "1.0")),
+            hedging=os.getenv("FGA_HEDGING", "true").lower() not in ("0", "false", "no"),
+            initial_hedge_delay=float(os.getenv("FGA_HEDGE_DELAY", "0.05")),
+            max_hedge_ratio=float(os.getenv("FGA_MAX_HEDGE_RATIO", "0.1")),
+            hedge_burst=int(os.getenv("FGA_HEDGE_BURST", "20")),
+            breaker=CircuitBreaker(
+                failure_threshold=float(os.getenv("FGA_BREAKER_ERROR_RATE", "0.5")),
+                window=int(os.getenv("FGA_BREAKER_WINDOW", "50")),
+                min_calls=int(os.getenv("FGA_BREAKER_MIN_CALLS", "10")),
+                reset_timeout=float(os.getenv("FGA_BREAKER_RESET_TIMEOUT", "5.0")),
+            ),
+        )
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def hedge_delay(self) -> float:
+        """Delay before sending a hedged request: recent p95 latency."""
+        if len(self.latency) < self.min_samples:
+            return self.initial_hedge_delay
+        return max(self.min_hedge_delay, self.latency.percentile(self.hedge_percentile))
+
+    def _note_call(self, wants_hedge: bool) -> bool:
+        """Add this call's share to the hedge budget; return whether it may be hedged."""
+        with self._lock:
+            self._hedge_tokens = min(self.hedge_burst, self._hedge_tokens + self.max_hedge_ratio)
+            if not wants_hedge:
+                return False
+            if self._hedge_tokens < 1:
+                self.counters["hedges_suppressed"] += 1
+                return False
+            self._hedge_tokens -= 1
+            return True
+
+    async def check(self, client: Any, body: Any) -> Any:
+        """
+        Run client.check(body=body) resiliently and return its response.
+
+        Raises CircuitOpenError, asyncio.TimeoutError or the SDK error;
+        callers treat any exception as a denial (fail closed).
+        """
+        self._count("calls")
+        ticket = self.breaker.allow()
+        if ticket is None:
+            self._count("short_circuited")
+            raise CircuitOpenError("OpenFGA circuit breaker is open")
+
+        started = time.perf_counter()
+        # None: no outcome (cancelled or client error), only release a probe slot
+        outcome: Optional[bool] = None
+        try:
+            response = await asyncio.wait_for(self._hedged(client, body), self.timeout)
+            outcome = True
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            outcome = False
+            raise
+        except Exception as e:
+            if is_client_error(e):
+                self._count("client_errors")
+            else:
+                self._count("errors")
+                outcome = False
+            raise
+        finally:
+            if outcome is None:
+                self.breaker.release(ticket)
+            else:
+                self.breaker.record(ticket, outcome)
+
+        self.latency.add(time.perf_counter() - started)
+        return response
+
+    async def _hedged(self, client: Any, body: Any) -> Any:
+        primary = asyncio.ensure_future(client.check(body=body))
+        tasks = {primary}
+        try:
+            if not self.hedging:
+                return await primary
+
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if self._note_call(wants_hedge=not done):
+                self._count("hedged")
+                hedge = asyncio.ensure_future(client.check(body=body))
+                tasks.add(hedge)
+
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters, latency percentiles (ms) and circuit breaker state."""
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 2) if value is not None else None
+
+        with self._lock:
+            counters = dict(self.counters)
+            hedge_tokens = self._hedge_tokens
+        return {
+            **counters,
+            "hedge_ratio": round(counters["hedged"] / counters["calls"], 4) if counters["calls"] else 0.0,
+            "max_hedge_ratio": self.max_hedge_ratio,
+            "hedge_tokens": round(hedge_tokens, 2),
+            "latency_ms": {
+                "p50": ms(self.latency.percentile(50)),
+                "p95": ms(self.latency.percentile(95)),
+                "p99": ms(self.latency.percentile(99)),
+            },
+            "hedge_delay_ms": ms(self.hedge_delay()),
+            "breaker": self.breaker.stats(),
+        }
+
+# Process-wide checker used by FGAPostprocessor and the API
+fga_resilience = ResilientChecker.from_env()
@@ -0,0 +1,186 @@
+"""
+Multi-turn chat sessions.
+
+A session keeps the conversation history (trimmed to a token budget) and a
+working set of already-authorized nodes together with the time each
+document's permission was decided. Later turns only authorize documents
+whose decision is missing or stale.
+"""
+import os
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rough token estimate: 1 token ~ 4 characters
+CHARS_PER_TOKEN = 4
+
+@dataclass
+class Decision:
+    """Cached permission decision for one document."""
+    allowed: bool
+    decided_at: float
+    # Permission result as returned to the client (see FGAPostprocessor)
+    result: Dict[str, Any]
+
+@dataclass
+class ChatSession:
+    session_id: str
+    user_id: str
+    created_at: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.time)
+    # (role, content) pairs, oldest first
+    history: List[Tuple[str, str]] = field(default_factory=list)
+    # doc_id -> Decision
+    decisions: Dict[str, Decision] = field(default_factory=dict)
+    # node_id -> NodeWithScore, allowed nodes only, oldest first
+    working_set: "OrderedDict[str, Any]" = field(default_factory=OrderedDict)
+    # One turn at a time per session
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def fresh_decision(self, doc_id: str, ttl: float, now: Optional[float] = None) -> Optional[Decision]:
+        """Return the cached decision for doc_id unless it is older than ttl."""
+        decision = self.decisions.get(doc_id)
+        if decision is None:
+            return None
+        if (now or time.time()) - decision.decided_at > ttl:
+            return None
+        return decision
+
+    def remember(self, result: Dict[str, Any], node: Any, max_nodes: int, now: Optional[float] = None):
+        """Store a fresh decision and update the working set."""
+        doc_id = str(result["id"])
+        allowed = bool(result.get("allowed")) and "error" not in result
+        if "error" not in result:
+            # Errors are not cached: the next turn checks again
+            self.decisions[doc_id] = Decision(allowed=allowed, decided_at=now or time.time(), result=result)
+
+        self.update_working_set(node, allowed, max_nodes)
+
+    def update_working_set(self, node: Any, allowed: bool, max_nodes: int):
+        """
+        Add an allowed node as the most recently used one, or drop every chunk
+        of a denied document. Used for both fresh and cached decisions.
+        """
+        node_id = node.node.node_id
+        if allowed:
+            self.working_set[node_id] = node
+            self.working_set.move_to_end(node_id)
+            while len(self.working_set) > max_nodes:
+                self.working_set.popitem(last=False)
+        else:
+            # Permission revoked (or check failed): drop every chunk of the document
+            doc_id = str(node.node.ref_doc_id)
+            for key in [k for k, n in self.working_set.items() if str(n.node.ref_doc_id) == doc_id]:
+                del self.working_set[key]
+
+    def add_turn(self, question: str, answer: str, token_budget: int):
+        """Append a turn and condense history to fit the token budget."""
+        self.history.append(("user", question))
+        self.history.append(("assistant", answer))
+        self.history = condense_history(self.history, token_budget)
+
+def condense_history(history: List[Tuple[str, str]], token_budget: int) -> List[Tuple[str, str]]:
+    """
+    Keep the most recent turns that fit in token_budget.
+
+    History is trimmed in whole turns (a user question together with the
+    answer that follows it), so an answer is never kept without its
+    question. Single messages larger than half the budget are truncated so
+    one long answer cannot push out the rest of the conversation.
+    """
+    max_chars = token_budget * CHARS_PER_TOKEN
+    per_message = max_chars // 2
+
+    # Group into turns, each starting at a user message
+    turns: List[List[Tuple[str, str]]] = []
+    for role, content in history:
+        if role == "user" or not turns:
+            turns.append([])
+        if len(content) > per_message:
+            content = content[:per_message] + "..."
+        turns[-1].append((role, content))
+
+    kept: List[List[Tuple[str, str]]] = []
+    used = 0
+    for turn in reversed(turns):
+        size = sum(len(content) for _, content in turn)
+        if used + size > max_chars:
+            break
+        kept.append(turn)
+        used += size
+    kept.reverse()
+    return [message for turn in kept for message in turn]
+
+class SessionStore:
+    """In-memory sessions with an idle timeout and a cap on live sessions."""
+
+    def __init__(
+        self,
+        idle_timeout: float = 1800.0,
+        max_sessions: int = 1000,
+        decision_ttl: float = 60.0,
+        history_token_budget: int = 1024,
+        max_working_set: int = 8,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.decision_ttl = decision_ttl
+        self.history_token_budget = history_token_budget
+        self.max_working_set = max_working_set
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """Create a store configured from SESSION_* environment variables."""
+        return cls(
+            idle_timeout=float(os.getenv("SESSION_IDLE_TIMEOUT", "1800")),
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "1000")),
+            decision_ttl=float(os.getenv("SESSION_DECISION_TTL", "60")),
+            history_token_budget=int(os.getenv("SESSION_HISTORY_TOKENS", "1024")),
+            max_working_set=int(os.getenv("SESSION_MAX_WORKING_SET", "8")),
+        )
+
+    def create(self, user_id: str) -> ChatSession:
+        session = ChatSession(session_id=uuid.uuid4().hex, user_id=user_id)
+        with self._lock:
+            self._expire()
+            self._sessions[session.session_id] = session
+            # Memory cap: evict least recently used sessions
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Return a live session and mark it as recently used."""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_active = time.time()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"active": len(self._sessions), "max_sessions": self.max_sessions}
+
+    def _expire(self):
+        cutoff = time.time() - self.idle_timeout
+        # Sessions are kept in last-used order, so expired ones are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_active >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+# Process-wide session store
+session_store = SessionStore.from_env()
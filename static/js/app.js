@@ -20,19 +20,22 @@ const scenarioButtons = document.querySelectorAll(".scenario-btn");
 
 // Initialize
 async function init() {
-  await loadUsers();
-  await loadDocuments();
+  await loadBootstrap();
   setupEventListeners();
 }
 
-// Load users from API
-async function loadUsers() {
+// Load users and documents from API in one request
+// ("no-cache" revalidates with the ETag, so repeat loads get a 304)
+async function loadBootstrap() {
   try {
-    const response = await fetch("/api/users");
-    users = await response.json();
+    const response = await fetch("/api/bootstrap", { cache: "no-cache" });
+    const data = await response.json();
+    users = data.users;
+    documents = data.documents;
+    console.log("Loaded documents:", documents);
     renderUserCards();
   } catch (error) {
-    console.error("Failed to load users:", error);
+    console.error("Failed to load users and documents:", error);
   }
 }
 
@@ -371,16 +374,5 @@ function displayResults(data) {
   resultsSection.scrollIntoView({ behavior: "smooth", block: "start" });
 }
 
-// Load documents from API
-async function loadDocuments() {
-  try {
-    const response = await fetch("/api/documents");
-    documents = await response.json();
-    console.log("Loaded documents:", documents);
-  } catch (error) {
-    console.error("Failed to load documents:", error);
-  }
-}
-
 // Initialize on page load
 document.addEventListener("DOMContentLoaded", init);
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from resilient_fga import CircuitBreaker, CircuitOpenError, ResilientChecker
+
+class StubClient:
+    """Minimal stand-in for OpenFgaClient.check()."""
+
+    def __init__(self, delay: float = 0.0, error: BaseException = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def check(self, body):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return "ok"
+
+class StatusError(Exception):
+    """Mimics openfga_sdk ApiException, which carries the HTTP status."""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+def make_checker(**kwargs) -> ResilientChecker:
+    breaker = CircuitBreaker(failure_threshold=0.5, window=10, min_calls=2, reset_timeout=0.01)
+    return ResilientChecker(timeout=1.0, hedging=False, breaker=breaker, **kwargs)
+
+async def fail_until_open(checker: ResilientChecker):
+    down = StubClient(error=ConnectionError("down"))
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await checker.check(down, None)
+    assert checker.breaker.state == CircuitBreaker.OPEN
+
+def test_cancelled_half_open_probe_releases_slot():
+    async def scenario():
+        checker = make_checker()
+        await fail_until_open(checker)
+        await asyncio.sleep(0.02)
+
+        # The probe is cancelled mid-flight
+        probe = asyncio.ensure_future(checker.check(StubClient(delay=1.0), None))
+        await asyncio.sleep(0.01)
+        assert checker.breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # Backend is healthy again: the next call is the probe and closes the circuit
+        assert await checker.check(StubClient(), None) == "ok"
+        assert checker.breaker.state == CircuitBreaker.CLOSED
+        assert await checker.check(StubClient(), None) == "ok"
+
+    asyncio.run(scenario())
+
+def test_open_circuit_short_circuits():
+    async def scenario():
+        checker = make_checker()
+        checker.breaker.reset_timeout = 60
+        await fail_until_open(checker)
+        healthy = StubClient()
+        with pytest.raises(CircuitOpenError):
+            await checker.check(healthy, None)
+        assert healthy.calls == 0
+
+    asyncio.run(scenario())
+
+def test_concurrent_failures_open_circuit_once():
+    async def scenario():
+        checker = make_checker()
+        checker.breaker.min_calls = 4
+        checker.breaker.reset_timeout = 60
+        # One query fans out into many concurrent checks
+        down = StubClient(delay=0.01, error=ConnectionError("down"))
+        results = await asyncio.gather(*(checker.check(down, None) for _ in range(12)), return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert checker.breaker.state == CircuitBreaker.OPEN
+        assert checker.breaker.opened_count == 1
+
+    asyncio.run(scenario())
+
+def test_straggler_does_not_close_half_open_circuit():
+    async def scenario():
+        checker = make_checker()
+        # Admitted while closed, answers only after the circuit reopened
+        straggler = asyncio.ensure_future(checker.check(StubClient(delay=0.1), None))
+        await fail_until_open(checker)
+        await asyncio.sleep(0.02)
+
+        probe = asyncio.ensure_future(checker.check(StubClient(delay=0.2), None))
+        assert await straggler == "ok"
+        assert checker.breaker.state == CircuitBreaker.HALF_OPEN
+        # The probe is still in flight: no further calls get through
+        with pytest.raises(CircuitOpenError):
+            await checker.check(StubClient(), None)
+
+        assert await probe == "ok"
+        assert checker.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+def test_client_errors_do_not_open_circuit():
+    async def scenario():
+        checker = make_checker()
+        bad_request = StubClient(error=StatusError(400))
+        for _ in range(5):
+            with pytest.raises(StatusError):
+                await checker.check(bad_request, None)
+        assert checker.breaker.state == CircuitBreaker.CLOSED
+        assert checker.counters["client_errors"] == 5
+
+        # Server errors and rate limiting still count
+        for status in (503, 429):
+            with pytest.raises(StatusError):
+                await checker.check(StubClient(error=StatusError(status)), None)
+        assert checker.breaker.state == CircuitBreaker.OPEN
+
+    asyncio.run(scenario())
+
+def test_hedging_is_capped():
+    async def scenario():
+        checker = ResilientChecker(
+            timeout=1.0,
+            initial_hedge_delay=0.001,
+            max_hedge_ratio=0.25,
+            hedge_burst=2,
+        )
+        # Every call is slower than the hedge delay
+        slow = StubClient(delay=0.005)
+        for _ in range(20):
+            await checker.check(slow, None)
+
+        # The full bucket (2), then one hedge per 4 calls (ratio 0.25)
+        stats = checker.stats()
+        assert stats["hedged"] == 6
+        assert stats["hedges_suppressed"] == 14
+
+    asyncio.run(scenario())
+
+def test_hedge_budget_covers_concurrent_burst():
+    async def scenario():
+        checker = ResilientChecker(timeout=1.0, initial_hedge_delay=0.001, max_hedge_ratio=0.1, hedge_burst=20)
+        # A latency spike hits all checks of one query at once
+        slow = StubClient(delay=0.005)
+        await asyncio.gather(*(checker.check(slow, None) for _ in range(14)))
+        assert checker.counters["hedged"] == 14
+        assert checker.counters["hedges_suppressed"] == 0
+
+    asyncio.run(scenario())